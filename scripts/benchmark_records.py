@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+"""
+Shared loader for the benchmark-results.json report used by the push scripts
+"""
+import json
+import mmap
+import os
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def load_benchmark_json(json_file):
+    """Load a benchmark report, decoding with orjson from a read-only mmap when available"""
+    with open(json_file, 'rb') as f:
+        if orjson is None:
+            return json.loads(f.read())
+
+        # mmap refuses empty files; let orjson raise its usual decode error
+        if os.fstat(f.fileno()).st_size == 0:
+            return orjson.loads(b'')
+
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, memoryview(mm) as view:
+            return orjson.loads(view)
+
+def split_test_name(test_name):
+    """Split 'package.Class.method' into (class name, method name)"""
+    class_name, dot, method_name = test_name.rpartition('.')
+    if not dot:
+        return 'unknown', test_name
+    return class_name, method_name
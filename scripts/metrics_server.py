@@ -4,43 +4,42 @@ Start a simple HTTP server that exposes Prometheus metrics for Alloy to scrape
 """
 import os
 import sys
-from http.server import HTTPServer, BaseHTTPRequestHandler
-import threading
-import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 
-class MetricsHandler(BaseHTTPRequestHandler):
-    def do_GET(self):
-        if self.path == '/metrics':
-            # Read the metrics file
-            try:
-                with open('metrics.txt', 'r') as f:
-                    metrics = f.read()
+def create_metrics_handler(metrics_bytes):
+    """Build a request handler that serves an already-encoded metrics payload"""
+    content_length = str(len(metrics_bytes))
 
+    class MetricsHandler(BaseHTTPRequestHandler):
+        # HTTP/1.1 + Content-Length lets scrapers keep the connection alive
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            if self.path == '/metrics':
                 self.send_response(200)
                 self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', content_length)
                 self.end_headers()
-                self.wfile.write(metrics.encode('utf-8'))
-            except Exception as e:
-                self.send_response(500)
+                self.wfile.write(metrics_bytes)
+            else:
+                self.send_response(404)
+                self.send_header('Content-Length', '0')
                 self.end_headers()
-                self.wfile.write(f"Error: {e}".encode('utf-8'))
-        else:
-            self.send_response(404)
-            self.end_headers()
 
-    def log_message(self, format, *args):
-        # Suppress default logging
-        pass
+        def log_message(self, format, *args):
+            # Suppress default logging
+            pass
+
+    return MetricsHandler
 
-def start_server(port=9091):
+def start_server(port=9091, metrics_file='metrics.txt'):
     """Start the metrics server"""
-    server = HTTPServer(('127.0.0.1', port), MetricsHandler)
-    print(f"✅ Metrics server started on http://127.0.0.1:{port}/metrics")
+    # Metrics are generated before the server starts, so read them once
+    with open(metrics_file, 'rb') as f:
+        metrics_bytes = f.read()
 
-    # Run server in a thread
-    thread = threading.Thread(target=server.serve_forever)
-    thread.daemon = True
-    thread.start()
+    server = ThreadingHTTPServer(('127.0.0.1', port), create_metrics_handler(metrics_bytes))
+    print(f"✅ Metrics server started on http://127.0.0.1:{port}/metrics")
 
     return server
 
@@ -57,10 +56,10 @@ if __name__ == '__main__':
     print("   Press Ctrl+C to stop")
 
     try:
-        # Keep the main thread alive
-        while True:
-            time.sleep(1)
+        # Serve on the main thread; requests are handled on per-connection threads
+        server.serve_forever()
     except KeyboardInterrupt:
         print("\n🛑 Stopping server...")
-        server.shutdown()
+    finally:
+        server.server_close()
 
@@ -8,9 +8,22 @@ import os
 import subprocess
 import time
 from datetime import datetime
+from functools import lru_cache
 
+from benchmark_records import load_benchmark_json, split_test_name
+
+@lru_cache(maxsize=4096)
+def escape_label_value(value):
+    """Escape a Prometheus label value (memoized, class names repeat across benchmarks)"""
+    # Test names almost never need escaping, so check before building a new string
+    if '\\' not in value and '"' not in value and '\n' not in value:
+        return value
+    # Exposition format escapes backslash (first, so it is not doubled again), quote and newline
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+@lru_cache(maxsize=1)
 def get_git_branch():
-    """Get current git branch name"""
+    """Get current git branch name (cached, git is only spawned once per run)"""
     try:
         result = subprocess.run(
             ['git', 'rev-parse', '--abbrev-ref', 'HEAD'],
@@ -22,11 +35,8 @@ def get_git_branch():
     except:
         return os.getenv('GITHUB_REF_NAME', 'unknown')
 
-def parse_benchmark_json(json_file):
-    """Parse benchmark JSON and convert to Prometheus format"""
-
-    with open(json_file, 'r') as f:
-        data = json.load(f)
+def generate_prometheus_metrics(data):
+    """Convert a parsed benchmark report to Prometheus format lines"""
 
     # Get metadata
     git_commit = data.get('gitCommit', 'unknown')[:7]  # Short commit
@@ -34,7 +44,11 @@ def parse_benchmark_json(json_file):
     brand = data.get('brand', 'unknown')
     branch = get_git_branch()
 
-    metrics = []
+    # branch/device/brand/commit are the same for every benchmark in a report
+    const_labels = (
+        f'branch="{escape_label_value(branch)}",device="{escape_label_value(device)}",'
+        f'brand="{escape_label_value(brand)}",commit="{escape_label_value(git_commit)}"'
+    )
 
     # Process each benchmark
     benchmarks = data.get('benchmarks', [])
@@ -43,21 +57,15 @@ def parse_benchmark_json(json_file):
         test_name = benchmark.get('testName', 'unknown')
 
         # Split test name into class and method if possible
-        if '.' in test_name:
-            parts = test_name.rsplit('.', 1)
-            class_name = parts[0] if len(parts) > 1 else 'unknown'
-            method_name = parts[1] if len(parts) > 1 else test_name
-        else:
-            class_name = 'unknown'
-            method_name = test_name
-
-        # Escape quotes in labels
-        test_name_escaped = test_name.replace('"', '\\"')
-        class_name_escaped = class_name.replace('"', '\\"')
-        method_name_escaped = method_name.replace('"', '\\"')
-
-        # Common labels for all metrics
-        labels = f'test="{test_name_escaped}",class="{class_name_escaped}",method="{method_name_escaped}",branch="{branch}",device="{device}",brand="{brand}",commit="{git_commit}"'
+        class_name, method_name = split_test_name(test_name)
+
+        # Escape label values
+        test_name_escaped = escape_label_value(test_name)
+        class_name_escaped = escape_label_value(class_name)
+        method_name_escaped = escape_label_value(method_name)
+
+        # Common labels for all metrics, built once per benchmark
+        labels = f'test="{test_name_escaped}",class="{class_name_escaped}",method="{method_name_escaped}",{const_labels}'
 
         # Time metrics (in nanoseconds)
         min_time = benchmark.get('minTimeNs', 0)
@@ -66,9 +74,9 @@ def parse_benchmark_json(json_file):
 
         if median_time > 0:
             # No timestamp - Prometheus will add it when scraping
-            metrics.append(f'android_benchmark_time_ns{{{labels},stat="min"}} {min_time}')
-            metrics.append(f'android_benchmark_time_ns{{{labels},stat="median"}} {median_time}')
-            metrics.append(f'android_benchmark_time_ns{{{labels},stat="max"}} {max_time}')
+            yield f'android_benchmark_time_ns{{{labels},stat="min"}} {min_time}'
+            yield f'android_benchmark_time_ns{{{labels},stat="median"}} {median_time}'
+            yield f'android_benchmark_time_ns{{{labels},stat="max"}} {max_time}'
 
         # Allocation metrics
         min_alloc = benchmark.get('minAllocationCount', 0)
@@ -76,25 +84,20 @@ def parse_benchmark_json(json_file):
         max_alloc = benchmark.get('maxAllocationCount', 0)
 
         if median_alloc > 0:
-            metrics.append(f'android_benchmark_allocations{{{labels},stat="min"}} {min_alloc}')
-            metrics.append(f'android_benchmark_allocations{{{labels},stat="median"}} {median_alloc}')
-            metrics.append(f'android_benchmark_allocations{{{labels},stat="max"}} {max_alloc}')
+            yield f'android_benchmark_allocations{{{labels},stat="min"}} {min_alloc}'
+            yield f'android_benchmark_allocations{{{labels},stat="median"}} {median_alloc}'
+            yield f'android_benchmark_allocations{{{labels},stat="max"}} {max_alloc}'
 
         # Iterations
         iterations = benchmark.get('iterations', 0)
         if iterations > 0:
-            metrics.append(f'android_benchmark_iterations{{{labels}}} {iterations}')
+            yield f'android_benchmark_iterations{{{labels}}} {iterations}'
 
-    return metrics
-
-def push_to_grafana_influx_format(json_file):
+def push_to_grafana_influx_format(data):
     """
-    Alternative approach: Convert to InfluxDB line protocol format
-    which Grafana Cloud can accept via their InfluxDB-compatible endpoint
+    Alternative approach: Convert a parsed benchmark report to InfluxDB line
+    protocol format which Grafana Cloud can accept via their InfluxDB-compatible endpoint
     """
-    with open(json_file, 'r') as f:
-        data = json.load(f)
-
     git_commit = data.get('gitCommit', 'unknown')
     device = data.get('device', 'unknown')
     brand = data.get('brand', 'unknown')
@@ -108,9 +111,7 @@ def push_to_grafana_influx_format(json_file):
 
     for benchmark in benchmarks:
         test_name = benchmark.get('testName', 'unknown')
-        parts = test_name.rsplit('.', 1)
-        class_name = parts[0] if len(parts) > 1 else 'unknown'
-        method_name = parts[1] if len(parts) > 1 else test_name
+        class_name, method_name = split_test_name(test_name)
 
         # InfluxDB line protocol format
         # measurement,tag1=value1,tag2=value2 field1=value1,field2=value2 timestamp
@@ -126,11 +127,16 @@ def push_to_grafana_influx_format(json_file):
     return lines
 
 def main():
-    if len(sys.argv) != 2:
-        print("Usage: push_to_grafana.py <benchmark-results.json>")
+    args = sys.argv[1:]
+    write_influx = '--influx' in args
+    if write_influx:
+        args.remove('--influx')
+
+    if len(args) != 1:
+        print("Usage: push_to_grafana.py <benchmark-results.json> [--influx]")
         sys.exit(1)
 
-    json_file = sys.argv[1]
+    json_file = args[0]
 
     if not os.path.exists(json_file):
         print(f"❌ Error: File not found: {json_file}")
@@ -139,32 +145,44 @@ def main():
     print(f"📊 Parsing benchmark results from: {json_file}")
 
     try:
-        metrics = parse_benchmark_json(json_file)
+        data = load_benchmark_json(json_file)
+        metrics = generate_prometheus_metrics(data)
+        first_metric = next(metrics, None)
 
-        if not metrics:
+        if first_metric is None:
             print("⚠️  No metrics found in benchmark results")
             sys.exit(0)
 
-        print(f"✅ Generated {len(metrics)} metrics")
+        # Stream Prometheus format to file for curl to use, keeping a few lines as a sample
+        sample = [first_metric]
+        count = 1
+        with open('metrics.txt', 'w', buffering=1 << 20) as f:
+            write = f.write
+            write(first_metric)
+            for metric in metrics:
+                write('\n')
+                write(metric)
+                if count < 5:
+                    sample.append(metric)
+                count += 1
+
+        print(f"✅ Generated {count} metrics")
         print("\n📈 Sample metrics:")
-        for metric in metrics[:5]:
+        for metric in sample:
             print(f"  {metric}")
 
-        if len(metrics) > 5:
-            print(f"  ... and {len(metrics) - 5} more")
-
-        # Write Prometheus format to file for curl to use
-        with open('metrics.txt', 'w') as f:
-            f.write('\n'.join(metrics))
+        if count > 5:
+            print(f"  ... and {count - 5} more")
 
         print(f"\n✅ Metrics written to metrics.txt (Prometheus format)")
 
-        # Also generate InfluxDB format as alternative
-        influx_lines = push_to_grafana_influx_format(json_file)
-        with open('metrics_influx.txt', 'w') as f:
-            f.write('\n'.join(influx_lines))
+        # InfluxDB format is only generated on request, from the same parsed report
+        if write_influx:
+            influx_lines = push_to_grafana_influx_format(data)
+            with open('metrics_influx.txt', 'w') as f:
+                f.write('\n'.join(influx_lines))
 
-        print(f"✅ Metrics written to metrics_influx.txt (InfluxDB format)")
+            print(f"✅ Metrics written to metrics_influx.txt (InfluxDB format)")
 
     except json.JSONDecodeError as e:
         print(f"❌ Error parsing JSON: {e}")
@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 """
 Push benchmark metrics to Grafana Cloud using proper Prometheus Remote Write protocol
-Requires: prometheus-client, snappy, protobuf, requests
+Requires: python-snappy, requests
 """
 import os
 import sys
@@ -11,36 +11,107 @@ import struct
 import requests
 import snappy
 from datetime import datetime
-from google.protobuf import timestamp_pb2
-from prometheus_client.samples import Sample
 
-# Import the remote_write protobuf (we'll inline it since it's complex)
-# For simplicity, we'll use a direct approach with the write request format
+from benchmark_records import load_benchmark_json, orjson, split_test_name
 
-def create_remote_write_request(samples_data):
-    """
-    Create a Prometheus Remote Write request with protobuf + snappy
-    This is a simplified version that manually constructs the protobuf message
-    """
-    # We need to install prometheus-remote-write or build protobuf manually
-    # Let's use a simpler approach with the cortex/prometheus format
+# Maximum number of time series / uncompressed bytes per remote write request
+BATCH_SIZE = int(os.getenv('REMOTE_WRITE_BATCH_SIZE', '500'))
+BATCH_BYTES = int(os.getenv('REMOTE_WRITE_BATCH_BYTES', '2800000'))
+
+# The WriteRequest protobuf is small enough to encode by hand, so no generated code is needed
+# Format: https://github.com/prometheus/prometheus/blob/main/prompb/remote.proto
+#   WriteRequest { repeated TimeSeries timeseries = 1; }
+#   TimeSeries   { repeated Label labels = 1; repeated Sample samples = 2; }
+#   Label        { string name = 1; string value = 2; }
+#   Sample       { double value = 1; int64 timestamp = 2; }
+
+def _encode_varint(value):
+    """Encode a non-negative integer as a protobuf varint"""
+    out = bytearray()
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+def _encode_field(field_number, payload):
+    """Encode a length-delimited protobuf field"""
+    return _encode_varint(field_number << 3 | 2) + _encode_varint(len(payload)) + payload
 
-    # Build the WriteRequest protobuf manually (simplified)
-    # Format: https://github.com/prometheus/prometheus/blob/main/prompb/remote.proto
+def encode_timeseries(series):
+    """Encode one {'labels', 'value', 'timestamp'} series as a TimeSeries message"""
+    out = bytearray()
 
-    # For now, let's try a different approach: use the /api/v1/import endpoint
-    # which accepts JSON instead of protobuf
-    return None
+    # Remote write requires labels sorted by name
+    for name, value in sorted(series['labels'].items()):
+        label = _encode_field(1, name.encode('utf-8')) + _encode_field(2, str(value).encode('utf-8'))
+        out += _encode_field(1, label)
 
-def push_metrics_json(benchmark_file, grafana_url, grafana_user, grafana_token):
+    sample = b'\x09' + struct.pack('<d', float(series['value'])) + b'\x10' + _encode_varint(series['timestamp'])
+    out += _encode_field(2, sample)
+
+    return bytes(out)
+
+def create_remote_write_request(encoded_series):
+    """
+    Create a snappy-compressed Prometheus Remote Write request body
+    from WriteRequest.timeseries fields that are already encoded
+    """
+    return snappy.compress(b''.join(encoded_series))
+
+def iter_remote_write_batches(timeseries):
+    """
+    Yield (series count, request body) pairs, starting a new request once
+    BATCH_SIZE series or BATCH_BYTES uncompressed bytes would be exceeded
+    """
+    batch = []
+    batch_bytes = 0
+
+    for series in timeseries:
+        field = _encode_field(1, encode_timeseries(series))
+
+        if batch and (len(batch) >= BATCH_SIZE or batch_bytes + len(field) > BATCH_BYTES):
+            yield len(batch), create_remote_write_request(batch)
+            batch = []
+            batch_bytes = 0
+
+        batch.append(field)
+        batch_bytes += len(field)
+
+    if batch:
+        yield len(batch), create_remote_write_request(batch)
+
+def push_remote_write(timeseries, grafana_url, grafana_user, grafana_token):
+    """Push time series to a Remote Write endpoint, reusing one connection for all batches"""
+    with requests.Session() as session:
+        session.auth = (grafana_user, grafana_token)
+        session.headers.update({
+            'Content-Type': 'application/x-protobuf',
+            'Content-Encoding': 'snappy',
+            'X-Prometheus-Remote-Write-Version': '0.1.0'
+        })
+
+        for series_count, body in iter_remote_write_batches(timeseries):
+            try:
+                response = session.post(grafana_url, data=body, timeout=30)
+            except requests.exceptions.RequestException as e:
+                print(f"❌ Error pushing to Grafana: {e}")
+                return False
+
+            print(f"   Batch of {series_count} series: {response.status_code}")
+
+            if response.status_code not in [200, 201, 202, 204]:
+                print(f"⚠️  Unexpected response: {response.status_code}")
+                print(f"   Response: {response.text[:200]}")
+                return False
+
+    return True
+
+def push_metrics_json(data, grafana_url, grafana_user, grafana_token):
     """
     Try to push using VictoriaMetrics/InfluxDB compatible JSON format
     Some Grafana Cloud instances support /api/v1/import for JSON
     """
-    # Read benchmark results
-    with open(benchmark_file, 'r') as f:
-        data = json.load(f)
-
     # Extract metadata
     git_commit = data.get('gitCommit', 'unknown')[:7]
     device = data.get('device', 'unknown')
@@ -53,10 +124,10 @@ def push_metrics_json(benchmark_file, grafana_url, grafana_user, grafana_token):
 
     for benchmark in data.get('benchmarks', []):
         test_name = benchmark.get('testName', 'unknown')
-        parts = test_name.rsplit('.', 1)
-        class_name = parts[0] if len(parts) > 1 else 'unknown'
-        method_name = parts[1] if len(parts) > 1 else test_name
+        class_name, method_name = split_test_name(test_name)
 
+        # One labels dict per benchmark; __name__/stat are set in place and
+        # each series takes a single shallow copy
         labels = {
             '__name__': 'android_benchmark_time_ns',
             'test': test_name,
@@ -65,57 +136,38 @@ def push_metrics_json(benchmark_file, grafana_url, grafana_user, grafana_token):
             'branch': branch,
             'device': device,
             'brand': brand,
-            'commit': git_commit,
-            'stat': 'median'
+            'commit': git_commit
         }
 
         # Add time metric
         if benchmark.get('medianTimeNs', 0) > 0:
-            metrics.append({
-                'labels': {**labels, 'stat': 'min'},
-                'value': benchmark.get('minTimeNs', 0),
-                'timestamp': timestamp_ms
-            })
-            metrics.append({
-                'labels': {**labels, 'stat': 'median'},
-                'value': benchmark.get('medianTimeNs', 0),
-                'timestamp': timestamp_ms
-            })
-            metrics.append({
-                'labels': {**labels, 'stat': 'max'},
-                'value': benchmark.get('maxTimeNs', 0),
-                'timestamp': timestamp_ms
-            })
+            for stat, key in (('min', 'minTimeNs'), ('median', 'medianTimeNs'), ('max', 'maxTimeNs')):
+                labels['stat'] = stat
+                metrics.append({
+                    'labels': dict(labels),
+                    'value': benchmark.get(key, 0),
+                    'timestamp': timestamp_ms
+                })
 
         # Add allocation metrics
         if benchmark.get('medianAllocationCount', 0) > 0:
-            alloc_labels = {**labels}
-            alloc_labels['__name__'] = 'android_benchmark_allocations'
+            labels['__name__'] = 'android_benchmark_allocations'
 
-            metrics.append({
-                'labels': {**alloc_labels, 'stat': 'min'},
-                'value': benchmark.get('minAllocationCount', 0),
-                'timestamp': timestamp_ms
-            })
-            metrics.append({
-                'labels': {**alloc_labels, 'stat': 'median'},
-                'value': benchmark.get('medianAllocationCount', 0),
-                'timestamp': timestamp_ms
-            })
-            metrics.append({
-                'labels': {**alloc_labels, 'stat': 'max'},
-                'value': benchmark.get('maxAllocationCount', 0),
-                'timestamp': timestamp_ms
-            })
+            for stat, key in (('min', 'minAllocationCount'), ('median', 'medianAllocationCount'), ('max', 'maxAllocationCount')):
+                labels['stat'] = stat
+                metrics.append({
+                    'labels': dict(labels),
+                    'value': benchmark.get(key, 0),
+                    'timestamp': timestamp_ms
+                })
 
         # Add iterations
         if benchmark.get('iterations', 0) > 0:
-            iter_labels = {**labels}
-            iter_labels['__name__'] = 'android_benchmark_iterations'
-            del iter_labels['stat']  # No stat for iterations
+            labels['__name__'] = 'android_benchmark_iterations'
+            labels.pop('stat', None)  # No stat for iterations
 
             metrics.append({
-                'labels': iter_labels,
+                'labels': labels,
                 'value': benchmark.get('iterations', 0),
                 'timestamp': timestamp_ms
             })
@@ -140,81 +192,31 @@ def main():
     print("📊 Building metrics payload...")
 
     # Read benchmark results
-    with open(benchmark_file, 'r') as f:
-        data = json.load(f)
+    data = load_benchmark_json(benchmark_file)
 
     print(f"   Found {len(data.get('benchmarks', []))} benchmarks")
 
     # Build JSON payload
-    payload = push_metrics_json(benchmark_file, grafana_url, grafana_user, grafana_token)
+    payload = push_metrics_json(data, grafana_url, grafana_user, grafana_token)
 
     # Save payload for debugging
-    with open('payload.json', 'w') as f:
-        json.dump(payload, f, indent=2)
+    if orjson is not None:
+        with open('payload.json', 'wb') as f:
+            f.write(orjson.dumps(payload, option=orjson.OPT_INDENT_2))
+    else:
+        with open('payload.json', 'w') as f:
+            json.dump(payload, f, indent=2)
 
     print(f"   Generated {len(payload['timeseries'])} time series")
     print(f"\n📤 Pushing to Grafana Cloud...")
     print(f"   Endpoint: {grafana_url}")
 
-    # The endpoint expects Remote Write format with protobuf+snappy
-    # Since we can't easily do that, let's provide instructions instead
-
-    print("\n❌ Direct push with protobuf+snappy requires additional setup.")
-    print("   Your metrics have been prepared and saved to 'payload.json'")
-    print("\n✅ SOLUTION: Use Grafana Alloy (simplest approach)")
-    print("\n   Add this to your workflow:")
-    print("""
-      - name: Setup Grafana Alloy
-        run: |
-          sudo mkdir -p /etc/apt/keyrings/
-          wget -q -O - https://apt.grafana.com/gpg.key | gpg --dearmor | sudo tee /etc/apt/keyrings/grafana.gpg > /dev/null
-          echo "deb [signed-by=/etc/apt/keyrings/grafana.gpg] https://apt.grafana.com stable main" | sudo tee /etc/apt/sources.list.d/grafana.list
-          sudo apt-get update
-          sudo apt-get install -y alloy
-      
-      - name: Push metrics with Alloy
-        run: |
-          # Create Alloy config
-          cat > config.alloy << 'EOF'
-          prometheus.remote_write "default" {
-            endpoint {
-              url = "${{ secrets.GRAFANA_PROMETHEUS_URL }}"
-              basic_auth {
-                username = "${{ secrets.GRAFANA_PROMETHEUS_USER }}"
-                password = "${{ secrets.GRAFANA_PROMETHEUS_TOKEN }}"
-              }
-            }
-          }
-          
-          prometheus.exporter.self "default" { }
-          
-          prometheus.scrape "default" {
-            targets = concat(
-              prometheus.exporter.self.default.targets,
-            )
-            forward_to = [prometheus.remote_write.default.receiver]
-          }
-          EOF
-          
-          # Run Alloy (it will handle remote write properly)
-          alloy run config.alloy &
-          ALLOY_PID=$!
-          
-          # Give it time to start
-          sleep 5
-          
-          # Push metrics via Alloy's receiver
-          # (This requires additional setup to expose metrics)
-    """)
-
-    print("\n💡 Alternatively, you can:")
-    print("   1. Download 'payload.json' from artifacts")
-    print("   2. Manually import to Grafana Cloud")
-    print("   3. Or use the metrics in 'metrics.txt' with Prometheus")
-
-    # Don't fail - we've generated the files
-    sys.exit(0)
+    if push_remote_write(payload['timeseries'], grafana_url, grafana_user, grafana_token):
+        print("✅ Successfully pushed metrics to Grafana Cloud!")
+        sys.exit(0)
+
+    print("\n📝 Your metrics have been saved to 'payload.json'")
+    sys.exit(1)
 
 if __name__ == '__main__':
     main()
-
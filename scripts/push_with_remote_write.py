@@ -20,13 +20,14 @@ try:
 except ImportError:
     print("⚠️  Some optional dependencies missing, using alternative approach")
 
+from benchmark_records import load_benchmark_json, split_test_name
+
 def push_metrics_simple(benchmark_file, grafana_url, grafana_user, grafana_token):
     """
     Simple approach: Use prometheus_client with direct HTTP post
     """
     # Read benchmark results
-    with open(benchmark_file, 'r') as f:
-        data = json.load(f)
+    data = load_benchmark_json(benchmark_file)
 
     # Create registry
     registry = CollectorRegistry()
@@ -64,9 +65,7 @@ def push_metrics_simple(benchmark_file, grafana_url, grafana_user, grafana_token
     # Process each benchmark
     for benchmark in data.get('benchmarks', []):
         test_name = benchmark.get('testName', 'unknown')
-        parts = test_name.rsplit('.', 1)
-        class_name = parts[0] if len(parts) > 1 else 'unknown'
-        method_name = parts[1] if len(parts) > 1 else test_name
+        class_name, method_name = split_test_name(test_name)
 
         labels = {
             'test': test_name,